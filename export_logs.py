@@ -0,0 +1,30 @@
+# export_logs.py
+# Eksporterer samtalelogs til Parquet uden at starte Streamlit-brugerfladen
+# Køres fra app-mappen og kan planlægges, f.eks. med cron:
+#   0 3 * * * cd /sti/til/app && flock -n /tmp/export_logs.lock python export_logs.py
+
+import json
+import sys
+
+import streamlit.logger
+
+# Skjul Streamlits advarsler om at appen kører uden "streamlit run"
+streamlit.logger.set_log_level("error")
+
+from skatteagent import export_conversation_logs, logger
+
+
+def main():
+    """Kører en inkrementel eksport og skriver resultatet som JSON"""
+    try:
+        result = export_conversation_logs()
+    except Exception as e:
+        logger.error(f"Fejl ved eksport af logs: {e}")
+        return 1
+
+    print(json.dumps(result, ensure_ascii=False))
+    return 1 if result["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,14 +6,19 @@ import os
 import streamlit as st
 import uuid
 import time
-from datetime import datetime
+import random
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
 import json
-from openai import OpenAI
+from openai import OpenAI, APIConnectionError, APIStatusError, RateLimitError
 import pandas as pd
 import glob
 import logging
 import re
 import shutil
+import sys
+import threading
 
 # Konfiguration
 st.set_page_config(page_title="Skatteret Assistant", layout="wide")
@@ -27,6 +32,63 @@ ASSISTANT_ID = "asst_gknNNm2uyfxPyuzxx0JHfhtF"
 VECTOR_STORE_ID = "vs_67d1e99c789c8191bd776ac5437cbc08"
 PROMPTS_DIR = "prompts"
 LOGS_DIR = "logs"  # Ny mappe til samtalelogfiler
+LOGS_ARCHIVE_DIR = "logs_archive"  # Arkiverede samtalelogs fra opbevaringspolitikken
+LOG_INDEX_FILE = "index.jsonl"  # Indeks over samtalerne i hver månedsmappe (kun tilføjelser)
+LOG_INDEX_COMPACT_SLACK = 100  # Overflødige indekslinjer der tillades før indekset komprimeres
+
+# Opbevaringspolitik for samtalelogs (None = ingen grænse)
+LOG_RETENTION_DAYS = None  # Logs ældre end dette antal dage fjernes
+LOG_MAX_TOTAL_BYTES = None  # De ældste logs fjernes når den samlede størrelse overskrides
+LOG_RETENTION_GRACE_HOURS = 24  # Logs gemt inden for dette tidsrum kan høre til åbne sessioner og røres ikke
+LOG_RETENTION_ACTION = "archive"  # "archive" flytter til LOGS_ARCHIVE_DIR, "delete" sletter
+# Arkiverede logs beholdes i Parquet-eksporten - slettede logs fjernes også derfra
+
+# Begrænsning af samtalehistorik pr. session
+CHAT_WINDOW_SIZE = 20  # Antal beskeder der vises pr. side i samtalehistorikken
+MAX_MESSAGES_IN_MEMORY = 100  # Ældre beskeder fjernes fra session state og hentes fra loggen
+LOGS_EXPORT_DIR = "logs_export"  # Parquet-eksport af samtalelogs til analyse (køres med export_logs.py)
+ADMIN_MODE = os.environ.get("SKATTEAGENT_ADMIN") == "1"  # Viser administrative handlinger i sidebaren
+EXPORT_MANIFEST_FILE = os.path.join(LOGS_EXPORT_DIR, "manifest.json")
+
+# Kolonner og datatyper for de eksporterede Parquet-tabeller
+EXPORT_TABLES = {
+    "conversations": {
+        "conversation_id": "string",
+        "source_file": "string",
+        "title": "string",
+        "timestamp": "string",
+        "prompt_id": "string",
+        "message_count": "Int64",
+        "input_tokens": "Int64",
+        "output_tokens": "Int64",
+        "total_tokens": "Int64",
+    },
+    "messages": {
+        "conversation_id": "string",
+        "source_file": "string",
+        "message_index": "Int64",
+        "role": "string",
+        "content": "string",
+        "content_length": "Int64",
+    },
+}
+
+# Robusthed for OpenAI API-kald
+API_MAX_RETRIES = 3  # Antal genforsøg ved 429/5xx og netværksfejl
+API_BACKOFF_BASE = 0.5  # Sekunder før første genforsøg (fordobles for hvert forsøg)
+API_BACKOFF_MAX = 8.0  # Maksimal ventetid mellem genforsøg i sekunder
+API_RETRY_AFTER_MAX = 30.0  # Længere Retry-After end dette opgives i stedet for at vente
+API_HEDGE_DELAY = 1.5  # Sekunder før et hedget kald sender en ekstra identisk forespørgsel
+API_HEDGE_MAX_CONCURRENT = 8  # Maks samtidige ekstra forespørgsler - ellers springes hedging over
+API_TIMEOUTS = {  # Timeout i sekunder pr. endpoint
+    "default": 30.0,
+    "runs.retrieve": 10.0,
+    "messages.list": 15.0,
+    "files.create": 120.0,
+    "chat.completions.create": 20.0,
+}
+BREAKER_FAILURE_THRESHOLD = 5  # Fejl i træk før circuit breakeren åbner
+BREAKER_RESET_TIMEOUT = 30.0  # Sekunder før et nyt forsøg tillades efter breakeren er åbnet
 
 # Hardcoded struktur til svar
 HARDCODED_STRUCTURE = """Du er en skatterådgiver, der hjælper med at besvare spørgsmål om dansk skattelovgivning. 
@@ -78,6 +140,11 @@ if 'saved_conversations' not in st.session_state:
     st.session_state.saved_conversations = []
 if 'is_loaded_conversation' not in st.session_state:
     st.session_state.is_loaded_conversation = False
+# Session state til vinduesvisning af samtalehistorik
+if 'message_offset' not in st.session_state:
+    st.session_state.message_offset = 0  # Antal ældste beskeder der kun findes i loggen
+if 'history_pages' not in st.session_state:
+    st.session_state.history_pages = 0  # Antal ekstra sider med ældre beskeder der vises
 # Ny session state variabel til at styre om vi bruger hardcoded struktur
 if 'use_hardcoded_structure' not in st.session_state:
     st.session_state.use_hardcoded_structure = True
@@ -89,8 +156,203 @@ def get_openai_client():
     
     if not api_key:
         raise ValueError("OpenAI API-nøgle er ikke tilgængelig i miljøvariablen OPENAI_API_KEY")
+    
+    # Genforsøg håndteres af api_call, så klientens egne genforsøg slås fra
+    return OpenAI(api_key=api_key, max_retries=0)
+
+# FUNKTIONER TIL ROBUSTE API-KALD
+
+class CircuitOpenError(Exception):
+    """Kaldet blev afvist, fordi circuit breakeren er åben under et API-nedbrud"""
+
+# Funktion til at hente den fælles tilstand for API-kald på tværs af sessioner
+@st.cache_resource
+def get_api_state():
+    """Returnerer proces-global tilstand for tællere og circuit breaker"""
+    return {
+        "lock": threading.Lock(),
+        "counters": {
+            "calls": 0, "retries": 0, "hedged": 0, "hedges_skipped": 0,
+            "breaker_trips": 0, "breaker_rejections": 0,
+        },
+        "hedge_slots": threading.BoundedSemaphore(API_HEDGE_MAX_CONCURRENT),
+        "breaker": {"state": "closed", "failures": 0, "opened_at": 0.0, "probe_in_flight": False},
+    }
+
+# Funktion til at hente trådpuljen til hedgede kald
+@st.cache_resource
+def get_api_executor():
+    """Returnerer en fælles trådpulje til de ekstra forespørgsler i hedgede kald"""
+    return ThreadPoolExecutor(max_workers=API_HEDGE_MAX_CONCURRENT, thread_name_prefix="api-hedge")
+
+# Funktion til at tælle API-hændelser
+def increment_api_counter(name):
+    """Øger en af API-tællerne"""
+    api_state = get_api_state()
+    with api_state["lock"]:
+        api_state["counters"][name] += 1
+
+# Funktion til at tjekke circuit breakeren før et kald
+def check_circuit_breaker(endpoint):
+    """Fejler hurtigt med CircuitOpenError mens breakeren er åben
+    
+    Efter BREAKER_RESET_TIMEOUT slippes præcis ét prøvekald igennem (half_open);
+    alle andre afvises, indtil prøvekaldet har lukket eller genåbnet breakeren.
+    """
+    api_state = get_api_state()
+    with api_state["lock"]:
+        breaker = api_state["breaker"]
+        if breaker["state"] == "closed":
+            return
         
-    return OpenAI(api_key=api_key)
+        reset_due = time.monotonic() - breaker["opened_at"] >= BREAKER_RESET_TIMEOUT
+        if (breaker["state"] == "open" and reset_due) or (breaker["state"] == "half_open" and not breaker["probe_in_flight"]):
+            breaker.update(state="half_open", probe_in_flight=True)
+            return
+        api_state["counters"]["breaker_rejections"] += 1
+    
+    raise CircuitOpenError(f"OpenAI API er midlertidigt utilgængelig - {endpoint} blev ikke kaldt")
+
+# Funktion til at registrere et vellykket kald
+def record_api_success():
+    """Lukker circuit breakeren efter et kald som API'et har svaret på"""
+    api_state = get_api_state()
+    with api_state["lock"]:
+        api_state["breaker"].update(state="closed", failures=0, probe_in_flight=False)
+
+# Funktion til at frigive prøvekaldet når et kald fejler uden at nå API'et
+def release_breaker_probe():
+    """Lader et nyt prøvekald komme igennem uden at ændre breakerens tilstand"""
+    api_state = get_api_state()
+    with api_state["lock"]:
+        api_state["breaker"]["probe_in_flight"] = False
+
+# Funktion til at registrere et kald der fejlede pga. API'et
+def record_api_failure():
+    """Tæller en fejl og åbner circuit breakeren når grænsen nås"""
+    api_state = get_api_state()
+    with api_state["lock"]:
+        breaker = api_state["breaker"]
+        breaker["failures"] += 1
+        if breaker["state"] == "half_open" or breaker["failures"] >= BREAKER_FAILURE_THRESHOLD:
+            if breaker["state"] != "open":
+                api_state["counters"]["breaker_trips"] += 1
+                logger.warning(f"Circuit breaker åbnet efter {breaker['failures']} fejl i træk")
+            breaker.update(state="open", opened_at=time.monotonic(), probe_in_flight=False)
+
+# Funktion til at afgøre om en fejl skyldes API'et og ikke selve forespørgslen
+def is_transient_api_error(error):
+    """Returnerer True for 5xx-svar, timeouts og netværksfejl"""
+    if isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+# Funktion til at læse Retry-After fra et fejlsvar
+def get_retry_after(error):
+    """Returnerer ventetiden i sekunder fra Retry-After headeren, eller None"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    
+    try:
+        if headers.get("retry-after-ms"):
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            # Retry-After kan også være en HTTP-dato
+            retry_at = parsedate_to_datetime(value)
+            return max(0.0, (retry_at - datetime.now(retry_at.tzinfo)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+# Funktion til at sende et hedget kald
+def call_hedged(func, *args, **kwargs):
+    """Sender en ekstra identisk forespørgsel hvis den første er langsom, og returnerer det første svar
+    
+    Den første forespørgsel kører i sin egen tråd, så den aldrig står i kø bag andre kald,
+    og den kaldende tråd kan returnere det svar der kommer først. Kun den ekstra
+    forespørgsel bruger trådpuljen, og den springes over når alle pladser er optaget.
+    """
+    primary = Future()
+    
+    def run_primary():
+        try:
+            primary.set_result(func(*args, **kwargs))
+        except Exception as e:
+            primary.set_exception(e)
+    
+    threading.Thread(target=run_primary, name="api-primary", daemon=True).start()
+    futures = [primary]
+    
+    done, _ = wait(futures, timeout=API_HEDGE_DELAY)
+    if not done:
+        hedge_slots = get_api_state()["hedge_slots"]
+        if hedge_slots.acquire(blocking=False):
+            backup = get_api_executor().submit(func, *args, **kwargs)
+            backup.add_done_callback(lambda _: hedge_slots.release())
+            futures.append(backup)
+            increment_api_counter("hedged")
+        else:
+            increment_api_counter("hedges_skipped")
+    
+    error = None
+    for future in as_completed(futures):
+        try:
+            return future.result()
+        except Exception as e:
+            error = e
+    raise error
+
+# Funktion til at udføre et API-kald med timeout, genforsøg, hedging og circuit breaker
+def api_call(endpoint, func, *args, idempotent=False, hedge=False, **kwargs):
+    """Kalder func med endpointets timeout og genforsøger ved midlertidige fejl
+    
+    429 genforsøges altid, da forespørgslen ikke er behandlet. 5xx og netværksfejl
+    genforsøges kun for idempotente kald, så f.eks. en run ikke startes to gange.
+    Hedging bruges kun for idempotente kald.
+    """
+    kwargs.setdefault("timeout", API_TIMEOUTS.get(endpoint, API_TIMEOUTS["default"]))
+    
+    for attempt in range(API_MAX_RETRIES + 1):
+        check_circuit_breaker(endpoint)
+        increment_api_counter("calls")
+        try:
+            if hedge and idempotent:
+                result = call_hedged(func, *args, **kwargs)
+            else:
+                result = func(*args, **kwargs)
+            record_api_success()
+            return result
+        except Exception as e:
+            transient = is_transient_api_error(e)
+            if transient:
+                record_api_failure()
+            elif isinstance(e, APIStatusError):
+                # API'et svarede (f.eks. 4xx), så det er ikke nede
+                record_api_success()
+            else:
+                release_breaker_probe()
+            
+            retryable = isinstance(e, RateLimitError) or (transient and idempotent)
+            if not retryable or attempt == API_MAX_RETRIES:
+                raise
+            
+            # Respekter Retry-After, ellers eksponentiel backoff med jitter
+            delay = get_retry_after(e)
+            if delay is None:
+                delay = min(API_BACKOFF_MAX, API_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+            elif delay > API_RETRY_AFTER_MAX:
+                raise
+            
+            increment_api_counter("retries")
+            logger.warning(f"{endpoint} fejlede ({e}), genforsøger om {delay:.1f} sek. (forsøg {attempt + 1})")
+            time.sleep(delay)
 
 # Funktion til at indlæse alle tilgængelige prompts
 def load_available_prompts():
@@ -138,7 +400,12 @@ def create_or_update_assistant(client, assistant_id, enable_web_browsing=False):
     """Opretter eller opdaterer en assistent med de ønskede værktøjer"""
     try:
         # Hent den eksisterende assistent
-        assistant = client.beta.assistants.retrieve(assistant_id=assistant_id)
+        assistant = api_call(
+            "assistants.retrieve",
+            client.beta.assistants.retrieve,
+            assistant_id=assistant_id,
+            idempotent=True
+        )
         
         # Find de eksisterende værktøjer
         existing_tools = assistant.tools
@@ -152,9 +419,12 @@ def create_or_update_assistant(client, assistant_id, enable_web_browsing=False):
             new_tools = existing_tools + [{"type": "web_browsing"}]
             
             # Opdater assistenten
-            updated_assistant = client.beta.assistants.update(
+            updated_assistant = api_call(
+                "assistants.update",
+                client.beta.assistants.update,
                 assistant_id=assistant_id,
-                tools=new_tools
+                tools=new_tools,
+                idempotent=True
             )
             logger.info(f"Web browsing aktiveret for assistent {assistant_id}")
             return updated_assistant
@@ -164,9 +434,12 @@ def create_or_update_assistant(client, assistant_id, enable_web_browsing=False):
             new_tools = [tool for tool in existing_tools if tool.type != "web_browsing"]
             
             # Opdater assistenten
-            updated_assistant = client.beta.assistants.update(
+            updated_assistant = api_call(
+                "assistants.update",
+                client.beta.assistants.update,
                 assistant_id=assistant_id,
-                tools=new_tools
+                tools=new_tools,
+                idempotent=True
             )
             logger.info(f"Web browsing deaktiveret for assistent {assistant_id}")
             return updated_assistant
@@ -182,7 +455,12 @@ def create_or_update_assistant(client, assistant_id, enable_web_browsing=False):
 def get_assistant_info(client, assistant_id):
     """Henter information om en eksisterende assistant"""
     try:
-        assistant = client.beta.assistants.retrieve(assistant_id=assistant_id)
+        assistant = api_call(
+            "assistants.retrieve",
+            client.beta.assistants.retrieve,
+            assistant_id=assistant_id,
+            idempotent=True
+        )
         return assistant
     except Exception as e:
         st.error(f"Fejl ved hentning af assistant information: {e}")
@@ -191,12 +469,17 @@ def get_assistant_info(client, assistant_id):
 # Funktion til at uploade fil til OpenAI
 def upload_file(client, file_path):
     """Uploader en fil til OpenAI"""
-    try:
+    # Filen åbnes ved hvert forsøg, så et genforsøg ikke sender en halvt læst fil
+    def create_file(**kwargs):
         with open(file_path, "rb") as file:
-            response = client.files.create(
+            return client.files.create(
                 file=file,
-                purpose="assistants"
+                purpose="assistants",
+                **kwargs
             )
+    
+    try:
+        response = api_call("files.create", create_file)
         return response
     except Exception as e:
         st.error(f"Fejl ved upload af fil: {e}")
@@ -206,7 +489,7 @@ def upload_file(client, file_path):
 def create_thread(client):
     """Opretter en ny thread"""
     try:
-        thread = client.beta.threads.create()
+        thread = api_call("threads.create", client.beta.threads.create)
         return thread
     except Exception as e:
         st.error(f"Fejl ved oprettelse af thread: {e}")
@@ -216,7 +499,9 @@ def create_thread(client):
 def add_message_to_thread(client, thread_id, content):
     """Tilføjer en besked til en thread"""
     try:
-        message = client.beta.threads.messages.create(
+        message = api_call(
+            "messages.create",
+            client.beta.threads.messages.create,
             thread_id=thread_id,
             role="user",
             content=content
@@ -238,7 +523,9 @@ def run_assistant(client, thread_id, assistant_id):
         if instructions:
             kwargs["instructions"] = instructions
         
-        run = client.beta.threads.runs.create(
+        run = api_call(
+            "runs.create",
+            client.beta.threads.runs.create,
             thread_id=thread_id,
             assistant_id=assistant_id,
             **kwargs
@@ -252,9 +539,13 @@ def run_assistant(client, thread_id, assistant_id):
 def get_run_status(client, thread_id, run_id):
     """Henter status for en run"""
     try:
-        run = client.beta.threads.runs.retrieve(
+        run = api_call(
+            "runs.retrieve",
+            client.beta.threads.runs.retrieve,
             thread_id=thread_id,
-            run_id=run_id
+            run_id=run_id,
+            idempotent=True,
+            hedge=True
         )
         return run
     except Exception as e:
@@ -338,8 +629,12 @@ def update_token_count(run):
 def get_messages(client, thread_id):
     """Henter alle beskeder fra en thread"""
     try:
-        messages = client.beta.threads.messages.list(
-            thread_id=thread_id
+        messages = api_call(
+            "messages.list",
+            client.beta.threads.messages.list,
+            thread_id=thread_id,
+            idempotent=True,
+            hedge=True
         )
         return messages
     except Exception as e:
@@ -352,7 +647,9 @@ def add_file_to_assistant(client, assistant_id, file_id):
     try:
         # Prøv standardmetoden først
         try:
-            response = client.beta.assistants.files.create(
+            response = api_call(
+                "assistants.files.create",
+                client.beta.assistants.files.create,
                 assistant_id=assistant_id,
                 file_id=file_id
             )
@@ -364,7 +661,9 @@ def add_file_to_assistant(client, assistant_id, file_id):
             try:
                 # Tjek om file_attachments er tilgængelig
                 if hasattr(client.beta.assistants, "file_attachments"):
-                    response = client.beta.assistants.file_attachments.create(
+                    response = api_call(
+                        "assistants.file_attachments.create",
+                        client.beta.assistants.file_attachments.create,
                         assistant_id=assistant_id,
                         file_id=file_id
                     )
@@ -389,8 +688,11 @@ def get_assistant_files(client, assistant_id):
     try:
         # Prøv standardmetoden først
         try:
-            files = client.beta.assistants.files.list(
-                assistant_id=assistant_id
+            files = api_call(
+                "assistants.files.list",
+                client.beta.assistants.files.list,
+                assistant_id=assistant_id,
+                idempotent=True
             )
             return files
         except Exception as e1:
@@ -414,9 +716,12 @@ def delete_file_from_assistant(client, assistant_id, file_id):
     try:
         # Prøv standardmetoden først
         try:
-            response = client.beta.assistants.files.delete(
+            response = api_call(
+                "assistants.files.delete",
+                client.beta.assistants.files.delete,
                 assistant_id=assistant_id,
-                file_id=file_id
+                file_id=file_id,
+                idempotent=True
             )
             return response
         except Exception as e1:
@@ -426,9 +731,12 @@ def delete_file_from_assistant(client, assistant_id, file_id):
             try:
                 # Tjek om file_attachments er tilgængelig
                 if hasattr(client.beta.assistants, "file_attachments"):
-                    response = client.beta.assistants.file_attachments.delete(
+                    response = api_call(
+                        "assistants.file_attachments.delete",
+                        client.beta.assistants.file_attachments.delete,
                         assistant_id=assistant_id,
-                        file_id=file_id
+                        file_id=file_id,
+                        idempotent=True
                     )
                     return response
             except Exception as e2:
@@ -450,7 +758,7 @@ def delete_file_from_assistant(client, assistant_id, file_id):
 def get_available_files(client):
     """Henter alle filer i OpenAI kontoen"""
     try:
-        files = client.files.list()
+        files = api_call("files.list", client.files.list, idempotent=True)
         return files
     except Exception as e:
         st.error(f"Fejl ved hentning af tilgængelige filer: {e}")
@@ -483,7 +791,9 @@ def generate_conversation_title(client, messages, max_length=8):
         {context_str}
         """
         
-        response = client.chat.completions.create(
+        response = api_call(
+            "chat.completions.create",
+            client.chat.completions.create,
             model="gpt-3.5-turbo",  # Brug en billigere model til titlel-generering
             messages=[{"role": "user", "content": prompt}],
             max_tokens=40,
@@ -507,26 +817,334 @@ def generate_conversation_title(client, messages, max_length=8):
         # Generer en generisk titel baseret på dato og tid
         return f"Skattesamtale {datetime.now().strftime('%d-%m-%Y %H:%M')}"
 
+# FUNKTIONER TIL LOG-MAPPESTRUKTUR
+# Logs gemmes som logs/ÅÅÅÅ-MM/<id[:2]>/<id>.json, hvor måneden er oprettelsesmåneden.
+# Hver månedsmappe har et index.jsonl, så oversigter ikke behøver at åbne alle logfiler.
+# Indekset er en journal: hver gemning tilføjer én linje, og den seneste linje pr. ID gælder.
+# Låsen gælder kun inden for én proces - appen understøtter én Streamlit-proces pr. log-mappe.
+
+# Funktion til at hente en fælles lås til log-mappen på tværs af sessioner
+@st.cache_resource
+def get_log_lock():
+    """Returnerer en proces-global lås der beskytter logfiler og indeks"""
+    return threading.RLock()
+
+# Funktion til at finde en midlertidig sti ved siden af en fil
+def get_temp_path(file_path):
+    """Returnerer en unik skjult midlertidig sti i samme mappe som file_path
+    
+    Det foranstillede punktum gør, at Parquet-læsere og glob ignorerer halvskrevne filer.
+    """
+    directory, name = os.path.split(file_path)
+    return os.path.join(directory, f".{name}.{uuid.uuid4().hex}.tmp")
+
+# Funktion til at skrive JSON atomisk
+def write_json_atomic(file_path, data, indent=2):
+    """Skriver JSON til en midlertidig fil og erstatter derefter den rigtige fil"""
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    tmp_path = get_temp_path(file_path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
+    os.replace(tmp_path, file_path)
+
+# Funktion til at finde stien til en samtalelog
+def get_log_path(conversation_id, month, base_dir=LOGS_DIR):
+    """Returnerer stien til en samtalelog ud fra ID og oprettelsesmåned"""
+    if not re.fullmatch(r'[\w-]+', conversation_id or ""):
+        raise ValueError(f"Ugyldigt samtale-ID: {conversation_id}")
+    return os.path.join(base_dir, month, conversation_id[:2], f"{conversation_id}.json")
+
+# Funktion til at finde alle månedsmapper
+def get_log_months():
+    """Returnerer alle månedsmapper i log-mappen (ældste først)"""
+    if not os.path.isdir(LOGS_DIR):
+        return []
+    months = [
+        entry.name for entry in os.scandir(LOGS_DIR)
+        if entry.is_dir() and re.fullmatch(r'\d{4}-\d{2}', entry.name)
+    ]
+    return sorted(months)
+
+# Funktion til at finde oprettelsesmåneden for en samtale
+def find_conversation_month(conversation_id):
+    """Finder månedsmappen for en samtale uden at liste alle logfiler"""
+    for month in reversed(get_log_months()):
+        if os.path.exists(get_log_path(conversation_id, month)):
+            return month
+    return None
+
+# Funktion til at skrive et komprimeret indeks for en måned
+def write_log_index(month, index):
+    """Skriver månedsindekset atomisk med én linje pr. samtale"""
+    index_path = os.path.join(LOGS_DIR, month, LOG_INDEX_FILE)
+    tmp_path = get_temp_path(index_path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for conversation_id, entry in index.items():
+            f.write(json.dumps(dict(entry, id=conversation_id), ensure_ascii=False) + "\n")
+    os.replace(tmp_path, index_path)
+
+# Funktion til at genopbygge indekset for en måned
+def rebuild_log_index(month):
+    """Genopbygger index.jsonl for en måned ved at læse månedens logfiler"""
+    index = {}
+    for file_path in glob.glob(os.path.join(LOGS_DIR, month, "*", "*.json")):
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                log_data = json.load(f)
+            conversation_id = os.path.basename(file_path)[:-len(".json")]
+            index[conversation_id] = get_log_index_entry(log_data, os.path.getsize(file_path))
+        except Exception as e:
+            logger.error(f"Fejl ved indeksering af log-fil {file_path}: {e}")
+    
+    os.makedirs(os.path.join(LOGS_DIR, month), exist_ok=True)
+    write_log_index(month, index)
+    return index
+
+# Funktion til at indlæse indekset for en måned
+def load_log_index(month, compact=True):
+    """Indlæser index.jsonl for en måned - genopbygges hvis det mangler
+    
+    compact=False bruges fra andre processer end appen (f.eks. export_logs.py), så de
+    ikke erstatter journalen samtidig med at appen tilføjer linjer.
+    """
+    index_path = os.path.join(LOGS_DIR, month, LOG_INDEX_FILE)
+    with get_log_lock():
+        index = {}
+        line_count = 0
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line_count += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        logger.error(f"Ugyldig linje i log-indeks {index_path} springes over")
+                        continue
+                    
+                    conversation_id = record.pop("id", None)
+                    if record.get("deleted"):
+                        index.pop(conversation_id, None)
+                    elif conversation_id:
+                        index[conversation_id] = record
+        except FileNotFoundError:
+            return rebuild_log_index(month)
+        
+        # Komprimér journalen når den har mange overskrevne eller slettede linjer
+        if compact and line_count > len(index) + LOG_INDEX_COMPACT_SLACK:
+            write_log_index(month, index)
+        
+        return index
+
+# Funktion til at lave en indeks-post for en samtale
+def get_log_index_entry(log_data, size):
+    """Returnerer de metadata der gemmes om en samtale i månedsindekset"""
+    return {
+        "title": log_data.get("title"),
+        "timestamp": log_data.get("timestamp", ""),
+        "message_count": len(log_data.get("messages", [])),
+        "size": size
+    }
+
+# Funktion til at opdatere indekset for en måned
+def update_log_index(month, conversation_id, entry=None):
+    """Tilføjer, opdaterer eller fjerner (entry=None) en samtale i månedsindekset
+    
+    Ændringen tilføjes som én linje, så prisen ikke afhænger af månedens størrelse.
+    """
+    index_path = os.path.join(LOGS_DIR, month, LOG_INDEX_FILE)
+    record = {"id": conversation_id, "deleted": True} if entry is None else dict(entry, id=conversation_id)
+    with get_log_lock():
+        if not os.path.exists(index_path):
+            rebuild_log_index(month)
+        with open(index_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+# Funktion til at skrive en samtalelog
+def write_log_file(conversation_id, month, log_data):
+    """Skriver en samtalelog til den shardede struktur og opdaterer indekset"""
+    file_path = get_log_path(conversation_id, month)
+    write_json_atomic(file_path, log_data)
+    update_log_index(month, conversation_id, get_log_index_entry(log_data, os.path.getsize(file_path)))
+    return file_path
+
+# Funktion til at fjerne tomme mapper efter sletning eller arkivering
+def remove_empty_log_dirs(file_path):
+    """Fjerner shard- og månedsmappen hvis de er blevet tomme"""
+    shard_dir = os.path.dirname(file_path)
+    month_dir = os.path.dirname(shard_dir)
+    for directory in (shard_dir, month_dir):
+        try:
+            remaining = os.listdir(directory)
+            if not remaining or remaining == [LOG_INDEX_FILE]:
+                if remaining:
+                    os.remove(os.path.join(directory, LOG_INDEX_FILE))
+                os.rmdir(directory)
+        except OSError:
+            break
+
+# Funktion til at fjerne en samtalelog
+def remove_log_file(conversation_id, month, archive_dir=None):
+    """Sletter en samtalelog eller flytter den til archive_dir, og opdaterer indekset"""
+    file_path = get_log_path(conversation_id, month)
+    if archive_dir:
+        archive_path = get_log_path(conversation_id, month, base_dir=archive_dir)
+        os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+        shutil.move(file_path, archive_path)
+    else:
+        os.remove(file_path)
+    
+    update_log_index(month, conversation_id)
+    remove_empty_log_dirs(file_path)
+    return file_path
+
+# Funktion til at migrere logs fra den gamle flade mappestruktur
+def migrate_flat_logs():
+    """Flytter logs fra logs/*.json til den shardede struktur
+    
+    Gamle filer navngivet efter titel kan have flere filer pr. samtale-ID;
+    kun den nyeste version beholdes.
+    """
+    if not os.path.isdir(LOGS_DIR):
+        return {"migrated": 0, "removed": 0, "failed": 0}
+    
+    flat_files = [
+        entry.path for entry in os.scandir(LOGS_DIR)
+        if entry.is_file() and entry.name.endswith(".json")
+    ]
+    if not flat_files:
+        return {"migrated": 0, "removed": 0, "failed": 0}
+    
+    # Gruppér filerne efter samtale-ID og find den nyeste version af hver
+    latest = {}
+    files_by_id = {}
+    failed = 0
+    for file_path in flat_files:
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                log_data = json.load(f)
+        except Exception as e:
+            logger.error(f"Kunne ikke migrere log-fil {file_path}: {e}")
+            failed += 1
+            continue
+        
+        if not re.fullmatch(r'[\w-]+', str(log_data.get("id") or "")):
+            log_data["id"] = str(uuid.uuid4())
+        conversation_id = log_data["id"]
+        
+        files_by_id.setdefault(conversation_id, []).append(file_path)
+        sort_key = (log_data.get("timestamp") or "", os.path.getmtime(file_path))
+        if conversation_id not in latest or sort_key > latest[conversation_id][0]:
+            latest[conversation_id] = (sort_key, file_path, log_data)
+    
+    migrated = 0
+    removed = 0
+    with get_log_lock():
+        for conversation_id, (_, file_path, log_data) in latest.items():
+            month = find_conversation_month(conversation_id) or get_log_month(log_data.get("timestamp"), file_path)
+            write_log_file(conversation_id, month, log_data)
+            migrated += 1
+            
+            for old_path in files_by_id[conversation_id]:
+                os.remove(old_path)
+                removed += 1
+    
+    result = {"migrated": migrated, "removed": removed, "failed": failed}
+    logger.info(f"Flade logs migreret: {result}")
+    return result
+
+# Funktion til at anvende opbevaringspolitikken på samtalelogs
+def apply_log_retention(max_age_days=LOG_RETENTION_DAYS, max_total_bytes=LOG_MAX_TOTAL_BYTES, action=LOG_RETENTION_ACTION):
+    """Arkiverer eller sletter logs efter alder og samlet størrelse (ældste først)
+    
+    Logs gemt inden for LOG_RETENTION_GRACE_HOURS springes over, da en åben session
+    med message_offset > 0 skal kunne hente sine ældre beskeder fra loggen.
+    """
+    if action not in ("archive", "delete"):
+        raise ValueError(f"Ukendt handling for opbevaringspolitik: {action}")
+    if max_age_days is None and max_total_bytes is None:
+        return {"expired": 0, "freed_bytes": 0}
+    
+    # Saml alle samtaler fra indeksene - ældste først
+    entries = []
+    for month in get_log_months():
+        for conversation_id, entry in load_log_index(month).items():
+            entries.append((entry.get("timestamp") or "", month, conversation_id, entry.get("size", 0)))
+    entries.sort()
+    
+    # Nyligt gemte samtaler kan stadig være åbne og er derfor aldrig kandidater
+    grace_cutoff = (datetime.now() - timedelta(hours=LOG_RETENTION_GRACE_HOURS)).isoformat()
+    
+    expired = set()
+    if max_age_days is not None:
+        cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat()
+        expired.update(
+            (month, conversation_id) for timestamp, month, conversation_id, _ in entries
+            if timestamp < cutoff and timestamp < grace_cutoff
+        )
+    
+    if max_total_bytes is not None:
+        total_bytes = sum(size for timestamp, month, conversation_id, size in entries if (month, conversation_id) not in expired)
+        for timestamp, month, conversation_id, size in entries:
+            if total_bytes <= max_total_bytes or timestamp >= grace_cutoff:
+                break
+            if (month, conversation_id) not in expired:
+                expired.add((month, conversation_id))
+                total_bytes -= size
+    
+    archive_dir = LOGS_ARCHIVE_DIR if action == "archive" else None
+    freed_bytes = 0
+    sizes = {(month, conversation_id): size for _, month, conversation_id, size in entries}
+    with get_log_lock():
+        for month, conversation_id in expired:
+            try:
+                remove_log_file(conversation_id, month, archive_dir=archive_dir)
+                freed_bytes += sizes[(month, conversation_id)]
+            except FileNotFoundError:
+                update_log_index(month, conversation_id)
+            except Exception as e:
+                logger.error(f"Fejl ved opbevaringspolitik for samtale {conversation_id}: {e}")
+    
+    result = {"expired": len(expired), "freed_bytes": freed_bytes}
+    logger.info(f"Opbevaringspolitik anvendt ({action}): {result}")
+    return result
+
+# Funktion til at vedligeholde log-mappen
+@st.cache_resource
+def run_log_maintenance():
+    """Migrerer flade logs og anvender opbevaringspolitikken én gang pr. proces"""
+    try:
+        return {"migration": migrate_flat_logs(), "retention": apply_log_retention()}
+    except Exception as e:
+        logger.error(f"Fejl ved vedligeholdelse af logs: {e}")
+        return None
+
 # Funktion til at gemme en samtale
 def save_conversation(messages, title=None, active_prompt=None):
-    """Gemmer en samtale til en JSON-fil"""
+    """Gemmer en samtale til en JSON-fil
+    
+    messages er beskederne i hukommelsen - beskeder der er fjernet fra session
+    state (message_offset) hentes fra den eksisterende log og gemmes foran.
+    Skift af samtale skal ske via reset_conversation_state, så offset og log_id følges ad.
+    """
     try:
         if not messages:
             st.warning("Ingen beskedhistorik at gemme.")
             return None
         
+        if st.session_state.message_offset:
+            older_messages = get_logged_messages(0, st.session_state.message_offset)
+            if older_messages is None:
+                raise ValueError("Ældre beskeder kunne ikke hentes fra den gemte log")
+            messages = older_messages + list(messages)
+        
         # Generer et unikt ID til samtalen hvis ikke allerede gjort
         if not st.session_state.log_id:
             st.session_state.log_id = str(uuid.uuid4())
         
-        # Brug den eksisterende titel eller generer en sikker filnavns-sikker version
+        # Brug den eksisterende titel eller generer en standardtitel
         if not title:
             title = st.session_state.conversation_title or f"Samtale_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
         
-        # Generer et filnavns-sikkert ID baseret på titlen
-        safe_title = re.sub(r'[^\w\s-]', '', title).replace(' ', '_')
-        file_id = f"{safe_title}_{st.session_state.log_id[:8]}"
-        
         # Opret log-objektet
         log_data = {
             "id": st.session_state.log_id,
@@ -537,12 +1155,10 @@ def save_conversation(messages, title=None, active_prompt=None):
             "token_count": st.session_state.token_count
         }
         
-        # Definer filstien
-        file_path = os.path.join(LOGS_DIR, f"{file_id}.json")
-        
-        # Gem til fil
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(log_data, f, indent=2, ensure_ascii=False)
+        # Filen navngives efter samtalens ID, så en ny titel overskriver den samme fil
+        with get_log_lock():
+            month = find_conversation_month(st.session_state.log_id) or datetime.now().strftime("%Y-%m")
+            file_path = write_log_file(st.session_state.log_id, month, log_data)
         
         logger.info(f"Samtale gemt til {file_path}")
         return file_path
@@ -556,20 +1172,14 @@ def load_conversation(conversation_id):
     """Indlæser en gemt samtale fra fil"""
     try:
         # Find filstien fra ID
-        file_path = None
-        for log_file in glob.glob(os.path.join(LOGS_DIR, "*.json")):
-            with open(log_file, 'r', encoding='utf-8') as f:
-                log_data = json.load(f)
-                if log_data.get("id") == conversation_id:
-                    file_path = log_file
-                    break
+        month = find_conversation_month(conversation_id)
         
-        if not file_path:
+        if not month:
             st.error(f"Kunne ikke finde samtale med ID: {conversation_id}")
             return None
         
         # Indlæs samtalefilen
-        with open(file_path, 'r', encoding='utf-8') as f:
+        with open(get_log_path(conversation_id, month), 'r', encoding='utf-8') as f:
             conversation_data = json.load(f)
         
         return conversation_data
@@ -583,24 +1193,16 @@ def load_all_conversations():
     """Indlæser alle gemte samtaler fra log-mappen"""
     conversations = []
     try:
-        # Find alle .json filer i log-mappen
-        log_files = glob.glob(os.path.join(LOGS_DIR, "*.json"))
-        
-        # Sorter filerne efter ændringsdato (nyeste først)
-        log_files.sort(key=os.path.getmtime, reverse=True)
-        
-        for file_path in log_files:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    log_data = json.load(f)
-                
+        # Læs månedsindeksene i stedet for at åbne hver enkelt logfil
+        for month in get_log_months():
+            for conversation_id, entry in load_log_index(month).items():
                 # Opret en forenklet repræsentation
                 conversation = {
-                    "id": log_data.get("id"),
-                    "title": log_data.get("title", os.path.basename(file_path)),
-                    "timestamp": log_data.get("timestamp", ""),
-                    "message_count": len(log_data.get("messages", [])),
-                    "file_path": file_path
+                    "id": conversation_id,
+                    "title": entry.get("title") or conversation_id,
+                    "timestamp": entry.get("timestamp", ""),
+                    "message_count": entry.get("message_count", 0),
+                    "file_path": get_log_path(conversation_id, month)
                 }
                 
                 # Formatér tidsstempel til et menneskelæsbart format
@@ -611,8 +1213,9 @@ def load_all_conversations():
                     conversation["display_date"] = conversation["timestamp"]
                 
                 conversations.append(conversation)
-            except Exception as e:
-                logger.error(f"Fejl ved indlæsning af log-fil {file_path}: {e}")
+        
+        # Sorter samtalerne efter tidsstempel (nyeste først)
+        conversations.sort(key=lambda conversation: conversation["timestamp"] or "", reverse=True)
         
     except Exception as e:
         logger.error(f"Fejl ved indlæsning af samtaler: {e}")
@@ -623,24 +1226,16 @@ def load_all_conversations():
 def delete_conversation(conversation_id):
     """Sletter en gemt samtale"""
     try:
-        # Find filstien
-        file_path = None
-        for log_file in glob.glob(os.path.join(LOGS_DIR, "*.json")):
-            try:
-                with open(log_file, 'r', encoding='utf-8') as f:
-                    log_data = json.load(f)
-                    if log_data.get("id") == conversation_id:
-                        file_path = log_file
-                        break
-            except:
-                continue
-        
-        if not file_path:
-            st.error(f"Kunne ikke finde samtale med ID: {conversation_id}")
-            return False
-        
-        # Slet filen
-        os.remove(file_path)
+        with get_log_lock():
+            # Find filstien
+            month = find_conversation_month(conversation_id)
+            
+            if not month:
+                st.error(f"Kunne ikke finde samtale med ID: {conversation_id}")
+                return False
+            
+            # Slet filen
+            file_path = remove_log_file(conversation_id, month)
         logger.info(f"Samtale slettet: {file_path}")
         return True
     except Exception as e:
@@ -648,6 +1243,331 @@ def delete_conversation(conversation_id):
         st.error(f"Kunne ikke slette samtalen: {e}")
         return False
 
+# FUNKTIONER TIL BEGRÆNSET SAMTALEHISTORIK
+
+# Funktion til at hente beskeder fra den gemte log
+def get_logged_messages(start, end):
+    """Henter beskederne start:end for den aktuelle samtale fra den gemte log"""
+    if not st.session_state.log_id:
+        return None
+    
+    month = find_conversation_month(st.session_state.log_id)
+    if not month:
+        return None
+    
+    try:
+        with open(get_log_path(st.session_state.log_id, month), 'r', encoding='utf-8') as f:
+            log_data = json.load(f)
+    except Exception as e:
+        logger.error(f"Fejl ved hentning af ældre beskeder: {e}")
+        return None
+    
+    return log_data.get("messages", [])[start:end]
+
+# Funktion til at begrænse antallet af beskeder i hukommelsen
+def trim_session_messages():
+    """Gemmer samtalen og fjerner de ældste beskeder fra session state, når MAX_MESSAGES_IN_MEMORY overskrides"""
+    if len(st.session_state.messages) <= MAX_MESSAGES_IN_MEMORY:
+        return
+    
+    # Fjern ned til halvdelen af grænsen, så samtalen ikke gemmes ved hver ny besked
+    excess = len(st.session_state.messages) - MAX_MESSAGES_IN_MEMORY // 2
+    
+    # Beskederne fjernes kun, hvis de er gemt i loggen
+    file_path = save_conversation(st.session_state.messages, active_prompt=st.session_state.active_prompt)
+    if not file_path:
+        logger.warning("Samtalen kunne ikke gemmes - beholder alle beskeder i hukommelsen")
+        return
+    
+    del st.session_state.messages[:excess]
+    st.session_state.message_offset += excess
+
+# Funktion til at starte eller indlæse en samtale i session state
+def reset_conversation_state(conversation_data=None):
+    """Starter en ny samtale (uden argument) eller indlæser en gemt samtale i session state
+    
+    message_offset henviser til loggen for log_id, så beskeder, log-ID og historikvindue
+    sættes samlet. En indlæst samtale gemmes ikke igen - de ældste beskeder findes
+    allerede i loggen og holdes blot uden for hukommelsen.
+    """
+    conversation_data = conversation_data or {}
+    messages = list(conversation_data.get("messages", []))
+    kept = len(messages) if len(messages) <= MAX_MESSAGES_IN_MEMORY else MAX_MESSAGES_IN_MEMORY // 2
+    
+    st.session_state.log_id = conversation_data.get("id")
+    st.session_state.conversation_title = conversation_data.get("title")
+    st.session_state.messages = messages[len(messages) - kept:]
+    st.session_state.message_offset = len(messages) - kept
+    st.session_state.history_pages = 0
+    st.session_state.is_loaded_conversation = bool(conversation_data)
+    
+    # Gendan samtalens egne værdier, så senere gemninger ikke overskriver dem med sessionens
+    st.session_state.token_count = {"input": 0, "output": 0, "total": 0, **(conversation_data.get("token_count") or {})}
+    if conversation_data:
+        st.session_state.active_prompt = conversation_data.get("prompt_id")
+
+# Funktion til at tilføje en besked til samtalehistorikken
+def add_session_message(role, content):
+    """Tilføjer en besked til session state og håndhæver hukommelsesgrænsen"""
+    st.session_state.messages.append({"role": role, "content": content})
+    st.session_state.history_pages = 0
+    trim_session_messages()
+
+# Funktion til at vise samtalehistorikken
+def render_chat_history():
+    """Viser de seneste CHAT_WINDOW_SIZE beskeder med mulighed for at indlæse ældre"""
+    offset = st.session_state.message_offset
+    total = offset + len(st.session_state.messages)
+    start = max(0, total - CHAT_WINDOW_SIZE * (1 + st.session_state.history_pages))
+    
+    if start > 0:
+        if st.button(f"Indlæs ældre beskeder ({start} skjult)"):
+            st.session_state.history_pages += 1
+            st.rerun()
+    
+    # Beskeder der ikke længere er i hukommelsen hentes fra loggen og gemmes ikke i session state
+    visible_messages = []
+    if start < offset:
+        visible_messages = get_logged_messages(start, offset) or []
+    visible_messages += st.session_state.messages[max(0, start - offset):]
+    
+    for msg in visible_messages:
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])
+
+# Funktion til at estimere et objekts hukommelsesforbrug
+def estimate_object_size(obj, seen=None):
+    """Estimerer et objekts samlede størrelse i bytes inklusive indholdet af containere"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_object_size(key, seen) + estimate_object_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_object_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += estimate_object_size(vars(obj), seen)
+    return size
+
+# Funktion til at estimere hukommelsesforbruget for den aktuelle session
+def get_session_memory_usage():
+    """Estimerer hvor mange bytes sessionens session state fylder"""
+    return estimate_object_size({key: st.session_state[key] for key in st.session_state.keys()})
+
+# FUNKTIONER TIL EKSPORT AF LOGS TIL PARQUET
+
+# Funktion til at finde måneden for en samtalelog
+def get_log_month(timestamp, file_path):
+    """Returnerer måneden (ÅÅÅÅ-MM) for en log ud fra tidsstempel eller filens ændringsdato"""
+    try:
+        return datetime.fromisoformat(timestamp).strftime("%Y-%m")
+    except (TypeError, ValueError):
+        return datetime.fromtimestamp(os.path.getmtime(file_path)).strftime("%Y-%m")
+
+# Funktion til at omdanne en samtalelog til tabelrækker
+def conversation_to_rows(log_data, file_path):
+    """Omdanner en samtalelog til én samtale-række og en liste af besked-rækker"""
+    conversation_id = log_data.get("id")
+    token_count = log_data.get("token_count") or {}
+    messages = log_data.get("messages", [])
+    
+    conversation_row = {
+        "conversation_id": conversation_id,
+        "source_file": file_path,
+        "title": log_data.get("title"),
+        "timestamp": log_data.get("timestamp"),
+        "prompt_id": log_data.get("prompt_id"),
+        "message_count": len(messages),
+        "input_tokens": token_count.get("input", 0),
+        "output_tokens": token_count.get("output", 0),
+        "total_tokens": token_count.get("total", 0),
+    }
+    
+    message_rows = []
+    for index, msg in enumerate(messages):
+        content = str(msg.get("content", ""))
+        message_rows.append({
+            "conversation_id": conversation_id,
+            "source_file": file_path,
+            "message_index": index,
+            "role": msg.get("role"),
+            "content": content,
+            "content_length": len(content),
+        })
+    
+    return conversation_row, message_rows
+
+# Funktion til at indlæse eksport-manifestet
+def load_export_manifest():
+    """Indlæser manifestet over hvilke logfiler der allerede er eksporteret"""
+    if not os.path.exists(EXPORT_MANIFEST_FILE):
+        return {}
+    try:
+        with open(EXPORT_MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"Kunne ikke læse eksport-manifest, eksporterer alt igen: {e}")
+        return {}
+
+# Funktion til at gemme eksport-manifestet
+def save_export_manifest(manifest):
+    """Gemmer eksport-manifestet atomisk"""
+    write_json_atomic(EXPORT_MANIFEST_FILE, manifest)
+
+# Funktion til at finde stien til en månedspartition
+def get_export_partition_path(table_name, month):
+    """Returnerer stien til Parquet-filen for en tabel og måned (Hive-partitioneret)"""
+    return os.path.join(LOGS_EXPORT_DIR, table_name, f"month={month}", "part-0.parquet")
+
+# Funktion til at læse en månedspartition
+def read_export_partition(table_name, month):
+    """Læser en eksisterende månedspartition eller returnerer en tom DataFrame"""
+    partition_path = get_export_partition_path(table_name, month)
+    if not os.path.exists(partition_path):
+        return pd.DataFrame(columns=list(EXPORT_TABLES[table_name]))
+    return pd.read_parquet(partition_path)
+
+# Funktion til at skrive en månedspartition
+def write_export_partition(table_name, month, frame):
+    """Skriver en månedspartition atomisk - en tom partition fjernes"""
+    partition_path = get_export_partition_path(table_name, month)
+    
+    if frame.empty:
+        if os.path.exists(partition_path):
+            os.remove(partition_path)
+        return
+    
+    # Ensartede datatyper sikrer at alle partitioner har samme skema
+    dtypes = EXPORT_TABLES[table_name]
+    frame = frame.reindex(columns=list(dtypes)).astype(dtypes)
+    
+    os.makedirs(os.path.dirname(partition_path), exist_ok=True)
+    tmp_path = get_temp_path(partition_path)
+    frame.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, partition_path)
+
+# Funktion til at hente en fælles lås til eksporten på tværs af sessioner
+@st.cache_resource
+def get_export_lock():
+    """Returnerer en proces-global lås, så kun én eksport kører ad gangen"""
+    return threading.Lock()
+
+# Funktion til at eksportere samtalelogs til Parquet
+def export_conversation_logs():
+    """Eksporterer nye eller ændrede samtalelogs til partitionerede Parquet-tabeller
+    
+    Resultatet kan læses kolonnevis, f.eks.:
+    pd.read_parquet("logs_export/messages", columns=["role", "content_length"],
+                    filters=[("month", ">=", "2025-01")])
+    """
+    # Partitioner og manifest læses og omskrives, så samtidige eksporter serialiseres
+    with get_export_lock():
+        return export_changed_logs()
+
+# Funktion til at eksportere de logs der er ændret siden sidste eksport
+def export_changed_logs():
+    """Omskriver de månedspartitioner der berøres af nye, ændrede eller fjernede logs"""
+    manifest = load_export_manifest()
+    
+    # Find alle logfiler og deres nuværende tilstand via månedsindeksene
+    current_files = {}
+    for log_month in get_log_months():
+        for conversation_id, entry in load_log_index(log_month, compact=False).items():
+            file_path = get_log_path(conversation_id, log_month)
+            current_files[file_path] = {"timestamp": entry.get("timestamp"), "size": entry.get("size")}
+    
+    changed_files = [
+        file_path for file_path, state in current_files.items()
+        if file_path not in manifest
+        or manifest[file_path].get("timestamp") != state["timestamp"]
+        or manifest[file_path].get("size") != state["size"]
+    ]
+    missing_files = [
+        file_path for file_path in manifest
+        if file_path not in current_files and not manifest[file_path].get("archived")
+    ]
+    
+    # Logs arkiveret af opbevaringspolitikken beholder deres rækker, så historikken bevares
+    archived_files = [
+        file_path for file_path in missing_files
+        if os.path.exists(os.path.join(LOGS_ARCHIVE_DIR, os.path.relpath(file_path, LOGS_DIR)))
+    ]
+    removed_files = [file_path for file_path in missing_files if file_path not in archived_files]
+    
+    if not changed_files and not removed_files and not archived_files:
+        return {"exported": 0, "removed": 0, "archived": 0, "failed": 0, "months": []}
+    
+    # Måneder hvor tidligere eksporterede rækker skal erstattes
+    affected_months = {
+        manifest[file_path]["month"]
+        for file_path in changed_files + removed_files
+        if file_path in manifest
+    }
+    stale_files = set(changed_files) | set(removed_files)
+    
+    new_rows = {"conversations": {}, "messages": {}}
+    failed_files = set()
+    for file_path in changed_files:
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                log_data = json.load(f)
+            
+            month = get_log_month(log_data.get("timestamp"), file_path)
+            conversation_row, message_rows = conversation_to_rows(log_data, file_path)
+        except Exception as e:
+            logger.error(f"Fejl ved eksport af log-fil {file_path}: {e}")
+            failed_files.add(file_path)
+            continue
+        
+        new_rows["conversations"].setdefault(month, []).append(conversation_row)
+        new_rows["messages"].setdefault(month, []).extend(message_rows)
+        current_files[file_path]["month"] = month
+        affected_months.add(month)
+    
+    # Omskriv kun de berørte månedspartitioner
+    for month in affected_months:
+        for table_name, rows_by_month in new_rows.items():
+            existing = read_export_partition(table_name, month)
+            existing = existing[~existing["source_file"].isin(stale_files)]
+            
+            frames = [existing]
+            if rows_by_month.get(month):
+                frames.append(pd.DataFrame(rows_by_month[month]))
+            frames = [frame for frame in frames if not frame.empty]
+            
+            frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            write_export_partition(table_name, month, frame)
+    
+    # Fejlede filer udelades fra manifestet, så de forsøges igen næste gang
+    new_manifest = {}
+    for file_path, state in current_files.items():
+        if file_path in failed_files:
+            continue
+        if file_path in stale_files:
+            new_manifest[file_path] = state
+        else:
+            new_manifest[file_path] = {key: value for key, value in manifest[file_path].items() if key != "archived"}
+    
+    # Arkiverede logs huskes, så deres rækker ikke fjernes ved næste eksport
+    for file_path, state in manifest.items():
+        if file_path not in current_files and (state.get("archived") or file_path in archived_files):
+            new_manifest[file_path] = dict(state, archived=True)
+    save_export_manifest(new_manifest)
+    
+    result = {
+        "exported": len(changed_files) - len(failed_files),
+        "removed": len(removed_files),
+        "archived": len(archived_files),
+        "failed": len(failed_files),
+        "months": sorted(affected_months),
+    }
+    logger.info(f"Logs eksporteret til Parquet: {result}")
+    return result
+
 # Hovedsiden
 def main():
     st.title("Skatteretlig Assistant")
@@ -660,6 +1580,9 @@ def main():
     if not st.session_state.system_prompts:
         st.session_state.system_prompts = load_available_prompts()
     
+    # Migrér logs fra den gamle flade mappestruktur og anvend opbevaringspolitikken
+    run_log_maintenance()
+    
     # Indlæs gemte samtaler
     if not st.session_state.saved_conversations:
         st.session_state.saved_conversations = load_all_conversations()
@@ -679,6 +1602,27 @@ def main():
         st.write(f"**Vector Store ID:** {VECTOR_STORE_ID}")
         st.write(f"**Assistant ID:** {ASSISTANT_ID}")
         
+        # Vis hukommelsesforbrug for sessionen
+        st.write(f"**Session-hukommelse:** {get_session_memory_usage() / 1024:.1f} KB")
+        st.write(
+            f"**Beskeder i hukommelsen:** {len(st.session_state.messages)} "
+            f"(+{st.session_state.message_offset} kun i loggen)"
+        )
+        
+        # Vis tællere for API-laget
+        api_state = get_api_state()
+        with api_state["lock"]:
+            api_counters = dict(api_state["counters"])
+            breaker_state = api_state["breaker"]["state"]
+        st.write(
+            f"**API-kald:** {api_counters['calls']} ({api_counters['retries']} genforsøg, "
+            f"{api_counters['hedged']} hedgede, {api_counters['hedges_skipped']} uden hedging pga. fuld pulje)"
+        )
+        st.write(
+            f"**Circuit breaker:** {breaker_state} "
+            f"({api_counters['breaker_trips']} udløsninger, {api_counters['breaker_rejections']} afviste kald)"
+        )
+        
         # Vis token-tæller
         st.header("Token Forbrug")
         col_tokens1, col_tokens2 = st.columns(2)
@@ -734,3 +1678,24 @@ def main():
                         st.session_state.enable_web_browsing = enable_web
                         st.success(f"Web browsing {'aktiveret' if enable_web else 'deaktiveret'}")
                         st.rerun()  # Genindlæs siden for at vise ændringerne
+        
+        # Administrative handlinger - Parquet-eksporten køres separat med export_logs.py
+        retention_enabled = LOG_RETENTION_DAYS is not None or LOG_MAX_TOTAL_BYTES is not None
+        if ADMIN_MODE and retention_enabled:
+            st.header("Administration")
+            
+            # Opbevaringspolitikken kører automatisk ved opstart og kan køres igen manuelt
+            if st.button("Anvend opbevaringspolitik"):
+                with st.spinner("Rydder op i samtalelogs..."):
+                    try:
+                        result = apply_log_retention()
+                        st.success(f"{result['expired']} samtaler {'arkiveret' if LOG_RETENTION_ACTION == 'archive' else 'slettet'}")
+                    except Exception as e:
+                        logger.error(f"Fejl ved opbevaringspolitik: {e}")
+                        st.error(f"Kunne ikke anvende opbevaringspolitikken: {e}")
+    
+    # Håndhæv hukommelsesgrænsen uanset hvordan beskeder er kommet i session state
+    trim_session_messages()
+    
+    # Vis samtalehistorikken
+    render_chat_history()